@@ -10,13 +10,14 @@ type Args = {
   output?: string;
   startIndex: number;
   clean: boolean;
+  dedup: boolean;
 };
 
 function parseArgs(): Args {
   const argv = process.argv.slice(2);
   if (argv.length === 0) {
     console.error(
-      "Usage: bun run tinystories.ts <num_stories> [-o file] [--start-index N] [--no-clean]",
+      "Usage: bun run tinystories.ts <num_stories> [-o file] [--start-index N] [--no-clean] [--dedup]",
     );
     process.exit(1);
   }
@@ -28,6 +29,7 @@ function parseArgs(): Args {
   let output: string | undefined;
   let startIndex = 0;
   let clean = true;
+  let dedup = false;
   for (let i = 1; i < argv.length; i++) {
     const a = argv[i];
     if ((a === "-o" || a === "--output") && argv[i + 1]) {
@@ -36,11 +38,16 @@ function parseArgs(): Args {
       startIndex = Number(argv[++i]) || 0;
     } else if (a === "--no-clean") {
       clean = false;
+    } else if (a === "--dedup") {
+      dedup = true;
     }
   }
-  return { numStories, output, startIndex, clean };
+  return { numStories, output, startIndex, clean, dedup };
 }
 
+const WRITE_BUFFER_BYTES = 1 << 20; // 1 MiB
+const STORIES_PER_WRITE = 1024;
+
 function estimateSize(n: number) {
   const avg = 350; // chars/story
   const bytes = n * avg;
@@ -53,30 +60,57 @@ async function* iterRows(
   split = "train",
   startOffset = 0,
   batch = 100,
+  remaining: () => number = () => Infinity,
 ) {
   // /rows returns up to length=100; we’ll step the offset ourselves.
+  // `remaining` trims the first request for runs smaller than one page and
+  // gates read-ahead; later pages always ask for a full batch, since an
+  // extra round trip costs more than the surplus rows the caller discards.
   const base = "https://datasets-server.huggingface.co/rows";
-  let offset = startOffset;
-  while (true) {
+  const fetchPage = async (offset: number, length: number) => {
     const url = `${base}?dataset=${encodeURIComponent(dataset)}&config=default&split=${encodeURIComponent(
       split,
-    )}&offset=${offset}&length=${batch}`;
+    )}&offset=${offset}&length=${length}`;
     const res = await fetch(url);
     if (!res.ok) throw new Error(`HTTP ${res.status} from dataset API`);
     const json = await res.json();
     const rows = (json as any)?.rows as
       | Array<{ row: Record<string, unknown> }>
       | undefined;
-    if (!rows || rows.length === 0) break;
-    for (const r of rows) yield r.row;
+    return rows ?? [];
+  };
+  const request = (offset: number, length: number) => {
+    const p = fetchPage(offset, length);
+    p.catch(() => {}); // surfaced when awaited; avoids unhandled rejections on early exit
+    return p;
+  };
+
+  let offset = startOffset;
+  const first = Math.min(batch, Math.ceil(remaining()));
+  if (first <= 0) return;
+  let pending: ReturnType<typeof request> | undefined = request(offset, first);
+  while (pending) {
+    const rows = await pending;
+    if (rows.length === 0) break;
     offset += rows.length;
+
+    // If this page can't finish the run, request the next one before
+    // handing it out so the round trip overlaps with the caller's work.
+    pending = remaining() > rows.length ? request(offset, batch) : undefined;
+
+    for (const r of rows) yield r.row;
+
+    // Top up when empty or duplicate rows left the run short.
+    if (!pending && remaining() > 0) pending = request(offset, batch);
   }
 }
 
+const WHITESPACE_RUN = /\s+/g;
+
 function cleanText(s: string) {
   const t = s.trim();
   if (!t) return "";
-  return t.split(/\s+/).join(" ");
+  return t.replace(WHITESPACE_RUN, " ");
 }
 
 async function main() {
@@ -111,24 +145,57 @@ async function main() {
   console.log(`📁 Output file: ${outPath}`);
   console.log(`📏 Estimated size: ${estimateSize(args.numStories)}`);
   console.log(`🧹 Text cleaning: ${args.clean ? "enabled" : "disabled"}`);
+  console.log(`🔁 Deduplication: ${args.dedup ? "enabled" : "disabled"}`);
   console.log(`   Starting from index: ${args.startIndex.toLocaleString()}`);
 
   const file = Bun.file(outPath);
-  const writer = file.writer();
+  // A 1 MiB high-water mark lets a few batched writes accumulate in the
+  // sink before it flushes to disk.
+  const writer = file.writer({ highWaterMark: WRITE_BUFFER_BYTES });
 
   let written = 0;
   let processed = 0;
+  let duplicates = 0;
+  // With --dedup, stories whose 64-bit Bun.hash matches one already
+  // written are skipped. Only exact repeats are caught.
+  const seen = new Set<number | bigint>();
+
+  // Stories are joined into one string per batch so the sink sees a few
+  // large writes instead of one small write per story.
+  let batch: string[] = [];
+  const flush = async () => {
+    if (batch.length === 0) return;
+    const pending = writer.write(batch.join(""));
+    batch = [];
+    if (pending instanceof Promise) await pending;
+  };
 
   try {
-    for await (const row of iterRows(dataset, "train", args.startIndex, 100)) {
+    const rows = iterRows(
+      dataset,
+      "train",
+      args.startIndex,
+      100,
+      () => args.numStories - written,
+    );
+    for await (const row of rows) {
       processed++;
       const textRaw = String((row as any).text ?? "");
       const text = args.clean ? cleanText(textRaw) : textRaw;
       if (!text) continue;
+      if (args.dedup) {
+        const h = Bun.hash(text);
+        if (seen.has(h)) {
+          duplicates++;
+          continue;
+        }
+        seen.add(h);
+      }
 
-      await writer.write(text + "\n\n");
+      batch.push(text, "\n\n");
       written++;
 
+      if (written % STORIES_PER_WRITE === 0) await flush();
       if (written % 1000 === 0) {
         console.log(`   📝 Written ${written.toLocaleString()} stories...`);
       }
@@ -136,16 +203,21 @@ async function main() {
     }
   } catch (e: any) {
     console.error(`❌ Error: ${e.message ?? e}`);
+    await flush();
     await writer.end();
     process.exit(1);
   }
 
+  await flush();
   await writer.end();
 
   const size = Bun.file(outPath).size.toLocaleString();
   console.log("✅ Download complete!");
   console.log(`   📊 Stories written: ${written.toLocaleString()}`);
   console.log(`   📊 Stories processed: ${processed.toLocaleString()}`);
+  if (args.dedup) {
+    console.log(`   🔁 Duplicates skipped: ${duplicates.toLocaleString()}`);
+  }
   console.log(`   📁 File size: ${size} bytes`);
   console.log(`\n🎉 Successfully created ${outName}`);
 }